@@ -7,21 +7,57 @@ import re
 from io import BytesIO
 
 # ------------------ FILE PROCESSING ------------------ #
+DAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday']
+ROLL_HEADER_PATTERN = re.compile(r"roll no|registration number|reg no|roll number", re.IGNORECASE)
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+@st.cache_data(max_entries=32)
+def load_excel(file_bytes, header=0, dtype=None):
+    return pd.read_excel(BytesIO(file_bytes), header=header, dtype=dtype, engine="calamine")
+
+@st.cache_data(max_entries=32)
+def to_excel_bytes(df):
+    output = BytesIO()
+    with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
+        df.to_excel(writer, index=False)
+    return output.getvalue()
+
+def normalize_timetable(timetable):
+    timetable = timetable.copy()
+    for day in DAYS:
+        if day in timetable.columns:
+            timetable[day] = timetable[day].astype("string").str.replace(WHITESPACE_PATTERN, "", regex=True).str.upper()
+    return timetable
+
+def header_labels(values):
+    # Same labels read_excel(header=...) produces: "Unnamed: i" for blanks, ".1", ".2" suffixes for repeats
+    labels, counts = [], {}
+    for i, value in enumerate(values):
+        label = f"Unnamed: {i}" if pd.isna(value) else value
+        count = counts.get(label, 0)
+        while count:
+            counts[label] = count + 1
+            label = f"{label}.{count}"
+            count = counts.get(label, 0)
+        counts[label] = count + 1
+        labels.append(label)
+    return labels
+
 def process_uploaded_file(uploaded_file):
     try:
         ext = uploaded_file.name.split('.')[-1].lower()
         if ext == 'csv':
             df = pd.read_csv(uploaded_file)
         elif ext in ['xls', 'xlsx']:
-            raw_df = pd.read_excel(uploaded_file, header=None)
-            header_row = None
-            for i in range(min(15, len(raw_df))):
-                row = raw_df.iloc[i].astype(str).str.lower()
-                if row.str.contains("roll no|registration number|reg no|roll number").any():
-                    header_row = i
-                    break
-            if header_row is not None:
-                df = pd.read_excel(uploaded_file, header=header_row)
+            raw_df = load_excel(uploaded_file.getvalue(), header=None, dtype=object)
+            cells = raw_df.head(15).to_numpy(dtype=object)
+            hits = np.fromiter((bool(ROLL_HEADER_PATTERN.search(str(c))) for c in cells.ravel()), dtype=bool, count=cells.size)
+            header_rows = np.flatnonzero(hits.reshape(cells.shape).any(axis=1))
+            if header_rows.size:
+                header_row = int(header_rows[0])
+                df = raw_df.iloc[header_row + 1:].reset_index(drop=True)
+                df.columns = header_labels(raw_df.iloc[header_row])
+                df = df.infer_objects()
             else:
                 st.error("Could not detect header row.")
                 return None
@@ -52,44 +88,47 @@ def form_batches_by_subject(uploaded_files, batch_size):
         if df is not None:
             df = df[['division', 'roll no', 'student name']]
             df = df.reset_index(drop=True)
-            df['Batch'] = [f"{subject}{(i // batch_size) + 1}" for i in range(len(df))]
+            df['Batch'] = WHITESPACE_PATTERN.sub("", subject) + pd.Series(np.arange(len(df)) // batch_size + 1).astype(str)
             subject_batches[subject] = df
     return subject_batches
 
 # ------------------ CONFLICT DETECTION ------------------ #
+@st.cache_data(max_entries=32)
 def detect_conflicts(student_batches_df, timetable):
-    days = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday']
-    conflicts = []
-
-    student_batches_df['Batch Number'] = student_batches_df['Batch Number'].astype(str).str.replace(" ", "").str.upper()
-    known_batches = set(student_batches_df['Batch Number'].unique())
-
-    for day in days:
-        if day not in timetable.columns:
-            continue
-
-        daily_schedule = timetable[["Class time", day]].dropna()
-        for _, row in daily_schedule.iterrows():
-            time_slot = str(row["Class time"]).strip()
-            raw_batches = [x.strip().replace(" ", "").upper() for x in str(row[day]).split(";") if x.strip()]
-            active_batches = [b for b in raw_batches if b in known_batches]
-
-            filtered = student_batches_df[student_batches_df["Batch Number"].isin(active_batches)]
-            dupes = filtered["Registration Number"].value_counts()
-            conflicts_regs = dupes[dupes > 1].index.tolist()
-
-            for reg in conflicts_regs:
-                student_info = filtered[filtered["Registration Number"] == reg].iloc[0]
-                overlapping = filtered[filtered["Registration Number"] == reg]["Batch Number"].tolist()
-                conflicts.append({
-                    "Student Name": student_info["Student Name"],
-                    "Registration Number": reg,
-                    "Division": student_info["Division"],
-                    "Day": day,
-                    "Time Slot": time_slot,
-                    "Conflicting Batches": ", ".join(overlapping)
-                })
-    return pd.DataFrame(conflicts)
+    days = [day for day in DAYS if day in timetable.columns]
+
+    # One row per (timetable cell, batch), numbered day by day so "Cell" keeps the report in schedule order
+    slots = timetable.melt(id_vars="Class time", value_vars=days, var_name="Day", value_name="Batches")
+    slots = slots.dropna(subset=["Class time", "Batches"]).reset_index(names="Cell")
+    slots["Batch Number"] = slots["Batches"].astype("string").str.split(";")
+    slots = slots.explode("Batch Number")
+    slots = slots.drop_duplicates(["Cell", "Batch Number"])
+
+    # Shared categoricals let the merge hash integer codes instead of batch strings
+    batch_dtype = pd.CategoricalDtype(student_batches_df["Batch Number"].unique())
+    students = student_batches_df.astype({"Batch Number": batch_dtype}).reset_index(names="Row")
+    slots = slots.astype({"Day": pd.CategoricalDtype(days, ordered=True), "Batch Number": batch_dtype})
+    slots = slots.dropna(subset=["Batch Number"])
+
+    booked = slots.merge(students, on="Batch Number")
+    booked = booked.dropna(subset=["Registration Number"]).sort_values(["Cell", "Row"])
+    booked = booked[booked.duplicated(["Cell", "Registration Number"], keep=False)]
+    # Back to plain strings: joining per group over a categorical Series is far slower,
+    # and the report should not carry the merge-only dtypes
+    booked = booked.astype({"Batch Number": str, "Day": str})
+
+    conflicts = booked.drop_duplicates(["Cell", "Registration Number"])
+    conflicts = conflicts.assign(**{
+        "Time Slot": conflicts["Class time"].astype(str).str.strip(),
+        "Conflicting Batches": booked.groupby(["Cell", "Registration Number"], sort=False)["Batch Number"].agg(", ".join).to_numpy()
+    })
+    return conflicts[["Student Name", "Registration Number", "Division", "Day", "Time Slot", "Conflicting Batches"]].reset_index(drop=True)
+
+# ------------------ DISPLAY ------------------ #
+def preview(df, n=500):
+    st.dataframe(df.head(n), use_container_width=True, hide_index=True)
+    if len(df) > n:
+        st.caption(f"Showing first {n} of {len(df):,} rows")
 
 # ------------------ STREAMLIT APP ------------------ #
 st.set_page_config(page_title="PCCOE Timetable Formulator", layout="centered")
@@ -108,14 +147,20 @@ if "subject_batches" in st.session_state:
     st.markdown("### ✅ Batch Formation Results")
     for subject, df in st.session_state.subject_batches.items():
         st.markdown(f"#### Batches for {subject}")
-        st.dataframe(df)
+        preview(df)
+        st.download_button(
+            f"Download {subject} Batches",
+            data=to_excel_bytes(df),
+            file_name=f"{subject}_Batches.xlsx",
+            mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        )
 
     st.markdown("---")
     st.markdown("### Step 3: Upload Timetable Template")
     timetable_file = st.file_uploader("Upload the timetable Excel file", type=["xls", "xlsx"], key="timetable")
 
     if timetable_file:
-        timetable_template = pd.read_excel(timetable_file)
+        timetable_template = load_excel(timetable_file.getvalue())
         timetable_template.columns = timetable_template.columns.str.strip()
         st.success("✅ Timetable Template Loaded")
 
@@ -126,17 +171,13 @@ if "subject_batches" in st.session_state:
             temp_df.rename(columns={"roll no": "Registration Number", "student name": "Student Name", "Batch": "Batch Number", "division": "Division"}, inplace=True)
             combined_batches.append(temp_df[["Division", "Batch Number", "Registration Number", "Student Name", "Course"]])
         student_batches_df = pd.concat(combined_batches, ignore_index=True)
-        student_batches_df["Batch Number"] = student_batches_df["Batch Number"].str.replace(" ", "").str.upper()
 
-        st.session_state["uploaded_timetable"] = timetable_template
+        st.session_state["uploaded_timetable"] = normalize_timetable(timetable_template)
         st.markdown("#### Uploaded Timetable")
-        st.dataframe(timetable_template)
-        out = BytesIO()
-        with pd.ExcelWriter(out, engine="openpyxl") as writer:
-            timetable_template.to_excel(writer, index=False)
+        preview(timetable_template)
         st.download_button(
             "Download Uploaded Timetable",
-            data=out.getvalue(),
+            data=to_excel_bytes(timetable_template),
             file_name="Uploaded_Timetable.xlsx",
             mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
         )
@@ -146,13 +187,10 @@ if "subject_batches" in st.session_state:
             conflict_df = detect_conflicts(student_batches_df, st.session_state["uploaded_timetable"])
             if not conflict_df.empty:
                 st.warning("⚠️ Conflicts Detected!")
-                st.dataframe(conflict_df)
-                output = BytesIO()
-                with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                    conflict_df.to_excel(writer, index=False)
+                preview(conflict_df)
                 st.download_button(
                     "Download Conflict Report",
-                    data=output.getvalue(),
+                    data=to_excel_bytes(conflict_df),
                     file_name="Detected_Conflicts.xlsx",
                     mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
                 )